@@ -1,4 +1,55 @@
-import argparse, pandas as pd, matplotlib.pyplot as plt
+import argparse, glob, os, sys, matplotlib.pyplot as plt
+import numpy as np, pyarrow as pa, pyarrow.csv as pacsv, pyarrow.parquet as pq
+
+MAX_POINTS = 4000
+COLUMNS = ['timestamp', 'rate_hz']
+
+def load_parquet(path):
+    # run.parquet/ holds one complete part file per flushed batch of rows
+    parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+    if not parts:
+        raise FileNotFoundError(path)
+    return pa.concat_tables(pq.read_table(p, columns=['seq'] + COLUMNS) for p in parts)
+
+def csv_span(path, tail=4096):
+    # First and last (seq, timestamp) from the head and tail of the CSV only
+    with open(path, 'rb') as f:
+        line = f.readline()
+        if line.startswith(b'sep='):
+            f.readline()
+        first = f.readline()
+        f.seek(max(f.tell(), os.path.getsize(path) - tail))
+        last = f.read().rstrip(b'\n').rsplit(b'\n', 1)[-1]
+    if not first.strip() or not last:
+        return None
+    return [tuple(row.split(b',', 6)[i].decode() for i in (0, 5)) for row in (first, last)]
+
+def covers(table, span):
+    if span is None or table.num_rows == 0:
+        return False
+    seq = table.column('seq').to_numpy()
+    # seq counts up by one per row and restarts at 1 with the logger, so any
+    # other step means a part was dropped
+    step = np.diff(seq)
+    if not np.all((step == 1) | (seq[1:] == 1)):
+        return False
+    ts = table.column('timestamp')
+    ends = [(str(seq[i]), ts[i].as_py().strftime('%Y-%m-%dT%H:%M:%SZ')) for i in (0, -1)]
+    return ends == span
+
+def load_csv(path):
+    # Skip the optional Excel "sep=," line
+    with open(path, 'r', encoding='utf-8') as f:
+        skip = 1 if f.readline().startswith('sep=') else 0
+    # Only the COLUMNS (timestamp, rate_hz) are parsed; the rest are skipped
+    return pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(skip_rows=skip),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=COLUMNS,
+            column_types={'timestamp': pa.timestamp('s', tz='UTC'), 'rate_hz': pa.float64()},
+        ),
+    )
 
 def main():
     ap = argparse.ArgumentParser()
@@ -6,11 +57,27 @@ def main():
     ap.add_argument('--out', required=True)
     args = ap.parse_args()
 
-    df = pd.read_csv(args.csv)
-    # Expect columns: seq,count,rate_hz,status,timestamp
-    df['t'] = pd.to_datetime(df['timestamp'])
+    # Prefer the columnar copy the logger writes next to the CSV (run.csv.1 ->
+    # run.parquet.1), but only if it holds exactly the CSV's rows; while the
+    # logger runs its last rows are still buffered, so use the CSV then.
+    d, name = os.path.split(args.csv)
+    pq_path = os.path.join(d, name.replace('.csv', '.parquet', 1))
+    table = None
+    try:
+        table = load_parquet(pq_path)
+        if not covers(table, csv_span(args.csv)):
+            print(f'{pq_path} does not match {args.csv}; plotting from the CSV', file=sys.stderr)
+            table = None
+    except (OSError, ValueError, pa.ArrowInvalid):
+        table = None
+    if table is None:
+        table = load_csv(args.csv)
+    t = table.column('timestamp').to_numpy(zero_copy_only=False)
+    r = table.column('rate_hz').to_numpy()
+    s = max(1, len(t) // MAX_POINTS)
+
     fig = plt.figure(figsize=(10,4))
-    plt.plot(df['t'], df['rate_hz'])
+    plt.plot(t[::s], r[::s])
     plt.title('Rate over time (Hz)')
     plt.xlabel('Time (UTC)')
     plt.ylabel('rate_hz')
@@ -18,4 +85,4 @@ def main():
     plt.savefig(args.out, dpi=150)
 
 if __name__ == '__main__':
-    main()  
\ No newline at end of file
+    main()
@@ -1,8 +1,40 @@
 from __future__ import annotations
-import os, io, shutil
-from datetime import datetime, timezone
-from threading import RLock
-from typing import Optional
+import os, atexit, shutil, threading, time
+from threading import RLock, Lock
+from typing import List, Optional
+from app.timestamps import utcstamp
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAVE_PYARROW = True
+except Exception:
+    pa = None
+    pq = None
+    _HAVE_PYARROW = False
+
+# Rows are queued by write_row() and written by a background flusher,
+# either every FLUSH_INTERVAL_SEC or as soon as FLUSH_ROWS are pending.
+FLUSH_INTERVAL_SEC = 0.05
+FLUSH_ROWS = 64
+
+# Rows are also mirrored to columnar part files in run.parquet/ (for analysis),
+# one complete file per PARQUET_ROWS rows. Once PARQUET_COMPACT_PARTS parts
+# exist they are merged into one, and the directory is compacted to a single
+# file when it rotates with run.csv, so both always hold the same rows.
+PARQUET_ROWS = 128
+PARQUET_COMPACT_PARTS = 16
+
+# One row in COLUMNS order; z / peer_rate_hz are pre-formatted since they may be empty.
+_ROW_FMT = "{},{},{},{:.9f},{},{},{},{},{:.6f},{},{:.9f},{:.6f},{},{},{}\n"
+
+def _peer_fields(rate, quality):
+    # Peer values arrive as untyped JSON from the LAN; keep them to float / str
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)):
+        rate = None
+    if quality is not None and not isinstance(quality, str):
+        quality = str(quality)
+    return rate, quality
 
 class CsvRotatingWriter:
     COLUMNS = [
@@ -11,6 +43,12 @@ class CsvRotatingWriter:
         "rate_target", "ppm_offset", "lock_state",
         "peer_rate_hz", "peer_quality"
     ]
+    PARQUET_TYPES = [
+        "int64", "int64", "int64", "float64", "string", "timestamp",
+        "float64", "string", "float64", "string",
+        "float64", "float64", "string",
+        "float64", "string"
+    ]
 
     def __init__(self, data_dir: str, max_bytes: int = 10_000_000, backup_count: int = 5, excel_sep: bool = False):
         self.data_dir = data_dir
@@ -18,37 +56,183 @@ class CsvRotatingWriter:
         self.max_bytes = max_bytes
         self.backup_count = backup_count
         self._path = os.path.join(self.data_dir, "run.csv")
-        self._lock = RLock()
+        self._lock = RLock()        # guards the file handle / rotation
+        self._qlock = Lock()        # guards the pending row queue
+        self._queue: List[str] = []
+        self._format_row = _ROW_FMT.format
+        self._pq_queue: List[tuple] = []
+        self._pq_rows: List[tuple] = []
+        self._pq_dir = os.path.join(self.data_dir, "run.parquet")
+        self._pq_on = False
+        self._pq_parts = 0
+        self._fd: Optional[int] = None
+        self._size = 0
         self.excel_sep = excel_sep
+        self._header = (("sep=,\n" if excel_sep else "") + ",".join(self.COLUMNS) + "\n").encode("utf-8")
         self._ensure_header()
+        if _HAVE_PYARROW:
+            self._pq_schema = pa.schema([
+                (name, pa.timestamp("s", tz="UTC") if t == "timestamp" else pa.type_for_alias(t))
+                for name, t in zip(self.COLUMNS, self.PARQUET_TYPES)
+            ])
+            os.makedirs(self._pq_dir, exist_ok=True)
+            self._pq_on = True
+            self._pq_parts = len(self._part_names())
 
-    def _ensure_header(self):
-        want = ",".join(self.COLUMNS) + "\n"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.stop)
 
-        if not os.path.exists(self._path) or os.path.getsize(self._path) == 0:
+    def _ensure_header(self):
+        if self._fd is None:
+            self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._size = os.fstat(self._fd).st_size
+        if self._size == 0:
             print(self._path)
-            with open(self._path, "w", encoding="utf-8", newline="") as f:
-                if self.excel_sep:
-                    f.write("sep=,\n")
-                f.write(want)
+            self._write(self._header)
 
     def path(self) -> str:
         return self._path
 
-    def rotate_if_needed(self):
-        if os.path.getsize(self._path) < self.max_bytes:
-            return
+    def _shift_backups(self, path: str):
         for i in range(self.backup_count, 0, -1):
-            src = f"{self._path}.{i}"
-            dst = f"{self._path}.{i+1}"
+            src = f"{path}.{i}"
+            dst = f"{path}.{i+1}"
             if os.path.exists(src):
                 if i == self.backup_count:
-                    os.remove(src)
+                    if os.path.isdir(src):
+                        shutil.rmtree(src)
+                    else:
+                        os.remove(src)
                 else:
                     os.replace(src, dst)
-        shutil.copy2(self._path, f"{self._path}.1")
-        open(self._path, "w").close()
+
+    def _write_part(self, table, name: str):
+        # Write under a temp name so readers only ever see complete parts
+        tmp = os.path.join(self._pq_dir, f".{name}.tmp")
+        try:
+            pq.write_table(table, tmp)
+            os.replace(tmp, os.path.join(self._pq_dir, name))
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _part_names(self) -> List[str]:
+        return sorted(f for f in os.listdir(self._pq_dir) if f.startswith("part-") and f.endswith(".parquet"))
+
+    def _compact_parquet(self):
+        parts = self._part_names()
+        if len(parts) < 2:
+            return
+        try:
+            table = pa.concat_tables(pq.read_table(os.path.join(self._pq_dir, p)) for p in parts)
+            # Replace the newest part with the merged rows, then drop the older ones
+            self._write_part(table, parts[-1])
+            for p in parts[:-1]:
+                os.unlink(os.path.join(self._pq_dir, p))
+        except (pa.ArrowException, OSError) as e:
+            print(f"[csv] parquet compaction failed: {e!r}")
+        self._pq_parts = len(self._part_names())
+
+    def _write_parquet(self):
+        if not self._pq_on or not self._pq_rows:
+            return
+        cols = list(zip(*self._pq_rows))
+        self._pq_rows = []
+        try:
+            arrays = [
+                pa.array(col).cast(field.type) if field.name == "timestamp" else pa.array(col, type=field.type)
+                for col, field in zip(cols, self._pq_schema)
+            ]
+            table = pa.Table.from_arrays(arrays, schema=self._pq_schema)
+            self._write_part(table, f"part-{time.time_ns()}.parquet")
+        except (pa.ArrowException, OSError) as e:
+            # Parquet is a secondary copy; drop the batch rather than stall the CSV
+            print(f"[csv] parquet batch dropped: {e!r}")
+            return
+        self._pq_parts += 1
+        if self._pq_parts >= PARQUET_COMPACT_PARTS:
+            self._compact_parquet()
+
+    def _write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            n = os.write(self._fd, view)
+            view = view[n:]
+        self._size += len(data)
+
+    def rotate_if_needed(self):
+        if self._size < self.max_bytes:
+            return
+        os.close(self._fd)
+        self._fd = None
+        self._shift_backups(self._path)
+        # rename is a metadata-only op; the next _ensure_header starts a fresh file
+        os.rename(self._path, f"{self._path}.1")
         self._ensure_header()
+        if self._pq_on:
+            # Finish the parts for the rows now in run.csv.1 and rotate alongside it
+            self._write_parquet()
+            self._compact_parquet()
+            try:
+                self._shift_backups(self._pq_dir)
+                os.rename(self._pq_dir, f"{self._pq_dir}.1")
+                os.makedirs(self._pq_dir, exist_ok=True)
+                self._pq_parts = 0
+            except OSError as e:
+                # run.csv has already rotated; stop mirroring rather than drift out of step
+                print(f"[csv] parquet rotation failed, parquet disabled: {e!r}")
+                self._pq_on = False
+
+    def flush(self):
+        # Drain inside _lock (order: _lock, then _qlock) so concurrent
+        # flushes write their batches in queue order
+        with self._lock:
+            with self._qlock:
+                batch, self._queue = self._queue, []
+                pq_batch, self._pq_queue = self._pq_queue, []
+            if self._fd is None:
+                if not batch:
+                    return
+                self._ensure_header()
+            if batch:
+                self._write("".join(batch).encode("utf-8"))
+            if self._pq_on:
+                self._pq_rows.extend(pq_batch)
+                if len(self._pq_rows) >= PARQUET_ROWS:
+                    self._write_parquet()
+            self.rotate_if_needed()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(FLUSH_INTERVAL_SEC)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The failed batch is already off the queue; keep logging later rows
+                print(f"[csv] flush failed: {e!r}")
+
+    def stop(self):
+        """Stop the flusher and write out any rows still queued."""
+        self._stop.set()
+        self._wake.set()
+        if self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=2)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[csv] final flush failed: {e!r}")
+        with self._lock:
+            self._write_parquet()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
 
     def write_row(
         self,
@@ -68,11 +252,23 @@ class CsvRotatingWriter:
         peer_rate_hz: Optional[float],
         peer_quality: Optional[str],
     ):
-        ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-        z_str = "" if (z is None) else f"{z:.9f}"
-        peer_rate_str = "" if (peer_rate_hz is None) else f"{peer_rate_hz: .9f}"
-        line = f"{seq},{count},{delta_count},{rate_hz:.9f},{status},{ts},{z_str},{drift_level},{window_sec:.6f},{quality},{rate_target:.9f},{ppm_offset:3f},{lock_state},{peer_rate_str},{peer_quality or ''} \n"
-        with self._lock:
-            self.rotate_if_needed()
-            with open(self._path, "a", encoding="utf-8", newline="") as f:
-                f.write(line)
\ No newline at end of file
+        ts = utcstamp()
+        peer_rate_hz, peer_quality = _peer_fields(peer_rate_hz, peer_quality)
+        z_str = "" if z is None else format(z, ".9f")
+        peer_rate_str = "" if peer_rate_hz is None else format(peer_rate_hz, ".9f")
+        line = self._format_row(
+            seq, count, delta_count, rate_hz, status, ts, z_str, drift_level,
+            window_sec, quality, rate_target, ppm_offset, lock_state,
+            peer_rate_str, peer_quality or "",
+        )
+        with self._qlock:
+            self._queue.append(line)
+            if _HAVE_PYARROW:
+                self._pq_queue.append((
+                    seq, count, delta_count, rate_hz, status, ts, z, drift_level,
+                    window_sec, quality, rate_target, ppm_offset, lock_state,
+                    peer_rate_hz, peer_quality,
+                ))
+            pending = len(self._queue)
+        if pending >= FLUSH_ROWS:
+            self._wake.set()
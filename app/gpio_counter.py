@@ -23,12 +23,13 @@
 # Warm-up: until N == REF_WINDOW_PULSES → quality="WARMUP" and clamp drift_level at most MED.
 
 from __future__ import annotations
-import os, threading, time, math, statistics
+import os, threading, time
 from dataclasses import dataclass
-from typing import Optional, Deque, Tuple
-from collections import deque
-from datetime import datetime, timezone
+from datetime import timedelta
+from typing import Optional, Tuple
+import numpy as np
 from dotenv import load_dotenv
+from app.timestamps import utcstamp
 
 load_dotenv()
 
@@ -44,11 +45,18 @@ Z_SEND_PORT = int(os.getenv("Z_SEND_PORT", 9787))
 EDGE_MODE = os.getenv("EDGE_MODE", "RISING").upper() 
 DEBOUNCE_US = int(os.getenv("DEBOUNCE_US", "0"))
 
+# lgpio: one Python callback per edge. gpiod: edges are drained in batches of
+# up to EDGE_BATCH with kernel timestamps, for high pulse rates.
+GPIO_BACKEND = os.getenv("GPIO_BACKEND", "lgpio").lower()
+GPIOD_CHIP = os.getenv("GPIOD_CHIP", "/dev/gpiochip0")
+EDGE_BATCH = 256
+
 QUALITY_JITTER_TAU = float(os.getenv("QUALITY_JITTER_TAU", 0.005))
 
 FORCE_MOCK = os.getenv("FORCE_MOCK", "0") == "1"
 MOCK_HZ = float(os.getenv("MOCK_HZ", 10.0))
 MOCK_JITTER = float(os.getenv("MOCK_JITTER", 0.02))
+MOCK_SPIN_NS = 2_000_000 # busy-wait the last 2 ms before each mock edge
 
 # Calibration / oscillator (exposed via app)
 RATE_TARGET = float(os.getenv("RATE_TARGET", 10.0)) # Hz
@@ -56,10 +64,22 @@ CAL_ON = os.getenv("CAL_ON", "0") == "1"
 Kp = float(os.getenv("CAL_KP", 200_000.0)) # proportional gain in ppm per 1.0 error
 Ki = float(os.getenv("CAL_KI", 20_000.0)) # integral gain in ppm per 1.0 error
 PPM_LIMIT = float(os.getenv("PPM_LIMIT", 200.0))
+CAL_DEADBAND = 1e-5 # |e| below this is treated as on-target
+
+# Drift class from |Z-1|: index = number of bounds reached
+_DRIFT_B0, _DRIFT_B1, _DRIFT_B2 = 2e-4, 1e-3, 5e-3
+_DRIFT_LABELS = ("LOW", "MED", "HIGH", "CRITICAL")
+_INF = float("inf")
 
 # Peer sync
 PEER_LOCK_ON = os.getenv("PEER_LOCK_ON", "0") == "1"
 
+# Z-ring storage: power of two with at least one spare slot beyond the
+# REF_WINDOW_PULSES+1 edges in use, so an edge landing mid-snapshot
+# never overwrites a slot being read.
+RING_SIZE = 1 << (REF_WINDOW_PULSES + 1).bit_length()
+RING_MASK = RING_SIZE - 1
+
 try:
     import lgpio
     _HAVE_LGPIO = True
@@ -67,6 +87,60 @@ except Exception:
     lgpio = None
     _HAVE_LGPIO = False
 
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except Exception:
+    njit = None
+    _HAVE_NUMBA = False
+
+try:
+    import gpiod
+    from gpiod.line import Edge
+    _HAVE_GPIOD = True
+except Exception:
+    gpiod = None
+    _HAVE_GPIOD = False
+
+def _median(a: np.ndarray) -> float:
+    # Quickselect via np.partition; skips np.median's NaN checks and extra copies
+    k = len(a) // 2
+    if len(a) % 2:
+        return float(np.partition(a, k)[k])
+    p = np.partition(a, (k - 1, k))
+    return 0.5 * float(p[k - 1] + p[k])
+
+def _ref_kernel(times: np.ndarray, n_ref: int) -> Tuple[int, float, float]:
+    """(N, r_ref, jitter_cv) from consecutive edge times; N == 0 means no usable data."""
+    intervals = np.diff(times)
+
+    # Remove obvious outliers (and any interval torn by a concurrent edge)
+    if len(intervals) >= 5:
+        med = _median(intervals)
+        max_ok = med * 5
+        intervals = intervals[(intervals > 0) & (intervals <= max_ok)]
+
+    N = min(n_ref, len(intervals))
+    if N == 0:
+        return 0, 0.0, 0.0
+
+    use = intervals[-N:]
+    T_ref = float(use.sum())
+    if T_ref <= 0:
+        return 0, 0.0, 0.0
+
+    r_ref = N / T_ref
+    mu = T_ref / N
+
+    sigma = float(use.std())
+    return N, r_ref, sigma / mu
+
+if _HAVE_NUMBA:
+    # Compiled without the GIL so edge callbacks keep running during the math
+    _median = njit(cache=True, nogil=True)(_median)
+    _ref_kernel = njit(cache=True, fastmath=True, nogil=True)(_ref_kernel)
+    _ref_kernel(np.arange(REF_WINDOW_PULSES + 1, dtype=np.float64), REF_WINDOW_PULSES)  # compile now, not on the first window
+
 @dataclass
 class Status:
     running: bool
@@ -107,16 +181,20 @@ class PulseCounter:
         self._thread: Optional[threading.Thread] = None
         self._chip = None
         self._cb = None
+        self._reader: Optional[threading.Thread] = None
         self._last_z = None
-        self._z_ref_times: Deque[float] = deque(maxlen=REF_WINDOW_PULSES + 1)
+        # Z-ring: edge times written at _count_total & RING_MASK by _edge_cb
+        self._ring = np.empty(RING_SIZE, dtype=np.float64)
+        self._ring_offsets = np.arange(-(REF_WINDOW_PULSES + 1), 0)
         self._z_last_emit = 0.0
 
         # calibration
         self._rate_target = RATE_TARGET
         self._ppm_offset = 0.0
         self._cal_on = CAL_ON
-        self._lock_state = "FREE" # FREE|WARMUP|LOCKED|HOLD
+        self._lock_state = "WARMUP" # FREE|WARMUP|LOCKED|HOLD, as of the last window
         self._i_term = 0.0
+        self._e_prev = 0.0
 
         # peer
         self._peer_rate_hz: Optional[float] = None
@@ -144,6 +222,10 @@ class PulseCounter:
             self._stop_evt.set()
         if self._thread:
             self._thread.join(timeout=5)
+        if self._reader:
+            # gpiod reader releases its line request on exit; wait so a restart can re-claim it
+            self._reader.join(timeout=1)
+            self._reader = None
         with self._lock:
             self._running = False
             self._thread = None
@@ -193,37 +275,64 @@ class PulseCounter:
             return
         now = time.monotonic()
         self._last_pulse_time = now
-        self._count_total += 1
-        self._z_ref_times.append(now)
+        n = self._count_total
+        self._ring[n & RING_MASK] = now
+        self._count_total = n + 1
+
+    def _store_edges(self, times: np.ndarray):
+        # Batched _edge_cb: only the newest RING_SIZE edges can land in the ring
+        n = self._count_total
+        k = len(times)
+        keep = times[-RING_SIZE:]
+        self._ring[(n + k - len(keep) + np.arange(len(keep))) & RING_MASK] = keep
+        self._last_pulse_time = float(times[-1])
+        self._count_total = n + k
+
+    def _configure_gpiod(self):
+        edge = {
+            "RISING": Edge.RISING,
+            "FALLING": Edge.FALLING,
+            "BOTH": Edge.BOTH,
+        }.get(EDGE_MODE, Edge.RISING)
+        settings = gpiod.LineSettings(edge_detection=edge, debounce_period=timedelta(microseconds=DEBOUNCE_US))
+        # Claimed here so a busy/missing line fails _run like _configure_lgpio does
+        req = gpiod.request_lines(GPIOD_CHIP, consumer="pulse-logger", config={GPIO_PIN: settings})
+        self._reader = threading.Thread(target=self._gpiod_reader, args=(req,), daemon=True)
+        self._reader.start()
+
+    def _gpiod_reader(self, req):
+        # Kernel event timestamps are CLOCK_MONOTONIC, the same clock as time.monotonic()
+        try:
+            while not self._stop_evt.is_set():
+                if not req.wait_edge_events(timedelta(seconds=0.1)):
+                    continue
+                events = req.read_edge_events(EDGE_BATCH)
+                if events:
+                    ts = np.fromiter((e.timestamp_ns for e in events), dtype=np.float64, count=len(events))
+                    self._store_edges(ts * 1e-9)
+        except Exception as e:
+            # Don't keep logging zero-rate windows: end the run with a STOPPED row
+            print(f"[gpio] gpiod reader failed: {e!r}")
+            self._stop_evt.set()
+        finally:
+            req.release()
+
+    def _ring_snapshot(self) -> np.ndarray:
+        # Lock-free copy of the last REF_WINDOW_PULSES+1 edges, oldest first;
+        # retry if more edges landed mid-copy than the spare slots absorb.
+        for _ in range(3):
+            n = self._count_total
+            times = self._ring[(n + self._ring_offsets) & RING_MASK]
+            if self._count_total - n < RING_SIZE - REF_WINDOW_PULSES - 1:
+                break
+        return times
 
     def _ref_stats(self) -> Optional[Tuple[int, float, float]]:
-        if len(self._z_ref_times) < (REF_WINDOW_PULSES + 1):
+        if self._count_total < (REF_WINDOW_PULSES + 1):
             return None
-        times = list(self._z_ref_times)
-        intervals = [t2 - t1 for t1, t2 in zip(times[:-1], times[1:])]
-
-        # Remove obvious outliers
-        if len(intervals) >= 5:
-            med = statistics.median(intervals)
-            max_ok = med * 5
-            intervals = [x for x in intervals if x <= max_ok]
-        
-        N = min(REF_WINDOW_PULSES, len(intervals))
+        N, r_ref, jitter_cv = _ref_kernel(self._ring_snapshot(), REF_WINDOW_PULSES)
         if N == 0:
             return None
-
-        use = intervals[-N:]
-        T_ref = sum(use)
-        if T_ref <= 0:
-            return None
-
-        r_ref = N / T_ref
-        mu = T_ref / N
-
-        var = sum((x - mu) ** 2 for x in use) / len(use)
-        sigma = math.sqrt(var)
-        jitter_cv = (sigma / mu) if mu > 0 else float("inf")
-        
         return N, r_ref, jitter_cv
 
     def _compute_window(self, now: float) -> Tuple[float, int, float]:
@@ -232,8 +341,8 @@ class PulseCounter:
         rate = (dc / dt) if dt > 0 else 0.0
         return dt, dc, rate
 
-    def _compute_z(self, window_sec: float, delta_count: int) -> Optional[float]:
-        stats = self._ref_stats()
+    @staticmethod
+    def _compute_z_from(stats: Optional[Tuple[int, float, float]], window_sec: float, delta_count: int) -> Optional[float]:
         if not stats:
             return None
  
@@ -248,19 +357,13 @@ class PulseCounter:
 
     @staticmethod
     def _drift_level(z: Optional[float], warmup: bool) -> str:
-        if z is None or not math.isfinite(z):
+        if z is None or z != z or z == _INF or z == -_INF:
             return "CRITICAL" if not warmup else "MED"
-        d = abs(z - 1.0)
-        if d < 2e-4:
-            return "LOW"
-        if d < 1e-4:
-            return "MED"
-        if d < 5e-3:
-            return "HIGH"
-        return "CRITICAL" if not warmup else "MED"
-
-    def _quality_and_lock(self) -> Tuple[str, str]:
-        stats = self._ref_stats()
+        d = z - 1.0 if z >= 1.0 else 1.0 - z
+        i = (d >= _DRIFT_B0) + (d >= _DRIFT_B1) + (d >= _DRIFT_B2)
+        return "MED" if warmup and i == 3 else _DRIFT_LABELS[i]
+
+    def _quality_from(self, stats: Optional[Tuple[int, float, float]]) -> Tuple[str, str]:
         if not stats:
             return "WARMUP", "WARMUP"
         N, _, jitter_cv = stats
@@ -275,9 +378,19 @@ class PulseCounter:
         if self.peer and self.peer.best_peer_rate is not None and PEER_LOCK_ON:
             target = self.peer.best_peer_rate
         e = (target - rate_hz) / target if target > 0 else 0.0
-
-        self._i_term += e * (window_sec / max(1.0, TIME_WINDOW_SEC))
-        ppm = Kp * e + Ki * self._i_term
+        if abs(e) < CAL_DEADBAND:
+            e = 0.0
+
+        # Trapezoidal integration; a late window counts for at most two nominal ones
+        dt_eff = min(window_sec, 2 * TIME_WINDOW_SEC) / max(1.0, TIME_WINDOW_SEC)
+        i_term = self._i_term + 0.5 * (e + self._e_prev) * dt_eff
+        ppm = Kp * e + Ki * i_term
+        if abs(ppm) > PPM_LIMIT and e * ppm > 0:
+            # Saturated and still pushing outward: hold the integrator (anti-windup)
+            i_term = self._i_term
+            ppm = Kp * e + Ki * i_term
+        self._i_term = i_term
+        self._e_prev = e
 
         ppm = max(-PPM_LIMIT, min(PPM_LIMIT, ppm))
         self._ppm_offset = ppm
@@ -289,23 +402,26 @@ class PulseCounter:
                 pass
 
     def _run(self):
-        use_mock = FORCE_MOCK or not _HAVE_LGPIO
+        use_gpiod = GPIO_BACKEND == "gpiod" and _HAVE_GPIOD
+        use_mock = FORCE_MOCK or not (_HAVE_LGPIO or use_gpiod)
         if use_mock:
             def _mock():
                 import random
-                period = 1.0 / max(1e-6, MOCK_HZ)
-                next_t = time.monotonic()
+                period_ns = 1e9 / max(1e-6, MOCK_HZ)
+                next_ns = time.monotonic_ns()
                 while not self._stop_evt.is_set():
                     self._edge_cb(None, GPIO_PIN, 1, 0)
                     jitter = (random.random() * 2 - 1) * MOCK_JITTER
-                    dt = period * max(0.0, 1.0 + jitter)
-                    next_t += dt
-                    while True:
-                        now = time.monotonic()
-                        rem = next_t - now
-                        if rem <= 0 or self._stop_evt.wait(min(0.01, rem)):
-                            break
+                    next_ns += int(period_ns * max(0.0, 1.0 + jitter))
+                    # Sleep until just before the edge, then spin for accurate timing
+                    rem_ns = next_ns - time.monotonic_ns()
+                    if rem_ns > MOCK_SPIN_NS and self._stop_evt.wait((rem_ns - MOCK_SPIN_NS) * 1e-9):
+                        break
+                    while time.monotonic_ns() < next_ns:
+                        pass
             threading.Thread(target=_mock, daemon=True).start()
+        elif use_gpiod:
+            self._configure_gpiod()
         else:
             self._configure_lgpio()
 
@@ -316,16 +432,24 @@ class PulseCounter:
         while not self._stop_evt.wait(0.01):
             now = time.monotonic()
             dt, dc, rate = self._compute_window(now)
-            if abs(dt - TIME_WINDOW_SEC) <0.2 and dt >= TIME_WINDOW_SEC:
+            window_due = abs(dt - TIME_WINDOW_SEC) <0.2 and dt >= TIME_WINDOW_SEC
+            z_due = Z_SEND_ENABLED and self.z_sender and (now - self._z_last_emit) >= Z_SEND_INTERVAL_SEC
+            if not (window_due or z_due):
+                continue
+            # Z-ring stats are shared by everything below for this tick
+            stats = self._ref_stats()
+
+            if window_due:
                 self._last_rate_hz = rate
-                warmup = (self._ref_stats() is None) or (self._ref_stats()[0] < REF_WINDOW_PULSES)
-                self._last_z = self._compute_z(dt, dc)
-                quality, lock_state = self._quality_and_lock()
-                drift = self._drift_level(z, warmup)
+                warmup = (stats is None) or (stats[0] < REF_WINDOW_PULSES)
+                self._last_z = self._compute_z_from(stats, dt, dc)
+                quality, lock_state = self._quality_from(stats)
+                drift = self._drift_level(self._last_z, warmup)
                 self._quality = quality
 
                 if warmup:
                     lock_state = "WARMUP"
+                self._lock_state = lock_state
                 if self._cal_on or PEER_LOCK_ON:
                     self._apply_calibration(rate, dt)
                 if self.peer:
@@ -354,10 +478,10 @@ class PulseCounter:
                 self._window_count0 = self._count_total
                 self._last_window_sec = dt
 
-            if Z_SEND_ENABLED and self.z_sender and (now - self._z_last_emit) >= Z_SEND_INTERVAL_SEC:
-                z = self._compute_z(max(1e-6, self._last_window_sec), dc)
-                stats = self._ref_stats()
+            if z_due:
+                z = self._compute_z_from(stats, max(1e-6, self._last_window_sec), dc)
                 jitter = stats[2] if stats else None
+                q, ls = self._quality_from(stats)
 
                 self.z_sender.emit_peer(
                     node_id=os.getenv("NODE_ID", os.uname().nodename),
@@ -366,19 +490,21 @@ class PulseCounter:
                     z=z,
                     jitter=jitter,
                     ppm_offset=self._ppm_offset,
-                    quality=self._quality_and_lock()[0],
-                    lock_state=self._quality_and_lock()[1]
+                    quality=q,
+                    lock_state=ls
                 )
                 self._z_last_emit = now
 
         now = time.monotonic()
         dt, dc, rate = self._compute_window(now)
-        z = self._compute_z(dt, dc)
-        quality, lock_state = self._quality_and_lock()
+        stats = self._ref_stats()
+        z = self._compute_z_from(stats, dt, dc)
+        quality, lock_state = self._quality_from(stats)
         drift = self._drift_level(z, (quality == "WARMUP"))
         self._seq += 1
         self._quality = quality
-        
+        self._lock_state = lock_state
+
         self.csv.write_row(
             seq=self._seq,
             count=self._count_total,
@@ -397,7 +523,7 @@ class PulseCounter:
         )
 
     def status(self) -> Status:
-        ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        ts = utcstamp()
         last_age = None
         if self._last_pulse_time is not None:
             last_age = max(0.0, time.monotonic() - self._last_pulse_time)
@@ -414,7 +540,7 @@ class PulseCounter:
             quality=self._quality,
             rate_target=self._rate_target,
             ppm_offset=self._ppm_offset,
-            lock_state=self._quality_and_lock()[1],
+            lock_state=self._lock_state,
             peer_rate_hz=self._peer_rate_hz,
             peer_quality=self._peer_quality,
         )
@@ -51,6 +51,7 @@ def stop():
 @app.get("/api/csv")
 def get_csv():
     filename = f"{datetime.now().strftime('%Y-%m-%d %H-%M-%S')}.csv"
+    csv.flush()
     return FileResponse(csv.path(), filename=filename)
 
 @app.post("/api/set_target")
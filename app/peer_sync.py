@@ -1,6 +1,14 @@
-import json, socket, threading, time, os
+import json, selectors, socket, threading, time, os
 from typing import Optional
 
+try:
+    import orjson
+    _loads = orjson.loads
+except Exception:
+    _loads = json.loads
+
+PEER_STALE_SEC = 30.0
+
 class PeerSync:
     def __init__(self, port: int = None):
         self.port = port or int(os.getenv("Z_SEND_PORT", 9787))
@@ -15,21 +23,29 @@ class PeerSync:
         threading.Thread(target=self._loop, daemon=True).start()
 
     def _loop(self):
-        self.sock.settimeout(0.5)
+        # Sleep in select() until a packet arrives or the oldest peer goes stale.
+        self.sock.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
         last_seen = {}
         while not self._stop.is_set():
+            timeout = None
+            if last_seen:
+                timeout = max(0.0, min(last_seen.values()) + PEER_STALE_SEC - time.time())
+            if not sel.select(timeout):
+                now = time.time()
+                drop = [k for k,v in last_seen.items() if now - v > PEER_STALE_SEC]
+                for k in drop: last_seen.pop(k, None)
+                continue
             try:
                 data, addr = self.sock.recvfrom(4096)
-            except socket.timeout:
-                data = None
+            except (BlockingIOError, InterruptedError):
+                continue
             if not data:
-                now = time.time()
-                drop = [k for k,v in last_seen.items() if now - v > 30]
-                for k in drop: last_seen.pop(k, None)
                 continue
             last_seen[addr[0]] = time.time()
             try:
-                obj = json.loads(data.decode("utf-8"))
+                obj = _loads(data)
             except Exception:
                 continue
             r = obj.get("rate_hz")
@@ -47,4 +63,4 @@ class PeerSync:
                     self.best_peer_rate = r
                     self.best_peer_quality = q
                     self.best_peer_jitter = j
-                    self.best_peer_ip = addr[0]
\ No newline at end of file
+                    self.best_peer_ip = addr[0]
@@ -0,0 +1,14 @@
+from __future__ import annotations
+import time
+
+_stamp = (-1, "")
+
+def utcstamp() -> str:
+    """UTC time as YYYY-MM-DDTHH:MM:SSZ, formatted at most once per second."""
+    global _stamp
+    sec = int(time.time())
+    cached = _stamp
+    if cached[0] != sec:
+        cached = (sec, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(sec)))
+        _stamp = cached
+    return cached[1]
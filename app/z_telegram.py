@@ -1,7 +1,14 @@
 from __future__ import annotations
-import json, socket, time, os
+import json, queue, socket, threading, time, os
 from typing import Optional
 
+try:
+    import orjson
+    _dumps = orjson.dumps
+except Exception:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 
 class ZSender:
     def __init__(self, host: str = None, port: int = None):
@@ -9,24 +16,32 @@ class ZSender:
         self.port = int(port or os.getenv("Z_SEND_PORT", 9787))
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # UDP is best-effort: never block on a full socket buffer, just drop the telegram
+        self.sock.setblocking(False)
+        if hasattr(socket, "IP_MTU_DISCOVER"):
+            # 0 == IP_PMTUDISC_DONT, which the socket module does not export
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MTU_DISCOVER, 0)
         self.peer_list = [x.strip() for x in os.getenv("PEER_LIST", "").split(",") if x.strip()]
+        self._dests = [(ip, self.port) for ip in self.peer_list] or [(self.host, self.port)]
+        # sendto() runs on a worker so a congested network never stalls the caller
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        threading.Thread(target=self._drain, daemon=True).start()
 
     def emit(self, z: Optional[float], N: int, quality: str = None):
         msg = {"z": z, "N": N, "quality": quality or ""}
-        self._send(json.dumps(msg).encode("utf-8"))
+        self._send(_dumps(msg))
     
     def emit_peer(self, **kwargs):
-        self._send(json.dumps(kwargs, ensure_ascii=False).encode('utf-8'))
+        self._send(_dumps(kwargs))
     
     def _send(self, payload: bytes):
-        if self.peer_list:
-            for ip in self.peer_list:
+        self._q.put_nowait(payload)
+
+    def _drain(self):
+        while True:
+            payload = self._q.get()
+            for dest in self._dests:
                 try:
-                    self.sock.sendto(payload, (ip, self.port))
-                except OSError:
+                    self.sock.sendto(payload, dest)
+                except OSError:  # includes BlockingIOError
                     pass
-        else:
-            try:
-                self.sock.sendto(payload, (self.host, self.port))
-            except OSError:
-                pass
\ No newline at end of file
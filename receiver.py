@@ -4,6 +4,16 @@ import socket
 import sys
 import time
 
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except Exception:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 
 def main():
     ap = argparse.ArgumentParser(description="Z-telegram UDP receiver")
@@ -22,14 +32,14 @@ def main():
         sys.exit(2)
 
     print(f"[receiver] listening on udp://{args.host}:{args.port}")
-    fp = open(args.jsonl, "a", encoding="utf-8") if args.jsonl else None
+    fp = open(args.jsonl, "ab") if args.jsonl else None
 
     try:
         while True:
             data, addr = sock.recvfrom(args.bufsize)
             ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
             try:
-                obj = json.loads(data.decode("utf-8"))
+                obj = _loads(data)
             except Exception:
                 if not args.quiet:
                     print(f"{ts} {addr} malformed: {data!r}")
@@ -45,7 +55,7 @@ def main():
 
             if fp:
                 out = {"ts": ts, "from": f"{addr[0]}:{addr[1]}", **obj}
-                fp.write(json.dumps(out, ensure_ascii=False) + "\n")
+                fp.write(_dumps(out) + b"\n")
                 fp.flush()
     except KeyboardInterrupt:
         pass